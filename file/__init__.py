@@ -6,8 +6,11 @@ Modules for file handling, espescially xtm style (.sli, .img etc) and h5 files.
 from p05tools.file.read_dat import read_dat
 from p05tools.file.parse_scanlog import parse_scanlog
 from p05tools.file.parse_kit_scanlog import parse_kit_scanlog
-from p05tools.file.idl_h5 import Idl2H5
+from p05tools.file.idl_h5 import Idl2H5, batch_idl2h5
 from p05tools.file.readh5 import readh5
+from p05tools.file.scanindex import ScanIndex
+from p05tools.file.storage import DatStorage, GpfsStorage, ScratchStorage, H5Storage, CachedStorage
 from p05tools.file.misc import mkdir, find
 
-__all__ = ['read_dat', 'parse_scanlog', 'Idl2H5', 'readh5', 'misc']
+__all__ = ['read_dat', 'parse_scanlog', 'Idl2H5', 'batch_idl2h5', 'readh5', 'ScanIndex',
+           'DatStorage', 'GpfsStorage', 'ScratchStorage', 'H5Storage', 'CachedStorage', 'misc']
@@ -1,11 +1,22 @@
 from p05tools.file.read_dat import read_dat
 from p05tools.file.parse_scanlog import parse_scanlog
+from p05tools.file.misc import mkdir
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import json
+import time
 import h5py
 import os
-import errno
 import datetime
 
 
+logger = logging.getLogger('reco_logger')
+
+# name of the marker file, written to the h5path of a completely converted scan
+_DONE_MARKER = '.idl2h5_done'
+
+
 class Idl2H5:
     '''Creates a h5 file from a IDL .img, .ref, .dar file. Full path to a file and the scanlog must be supplied.
     The scanlog will be parsed and the information is added as metadata to the h5 file. A file generated with Idl2H5
@@ -18,28 +29,160 @@ class Idl2H5:
         if scanlogpath:
             self.scanlog = parse_scanlog(self.scanlogpath)
 
-    def convertscan2h5(self):
-        for image in sorted(self.scanlog.scanimages):
-            data = read_dat(self.rawdatapath + self.scanlog.scanimages[image]['imagename']).data
-            metadata = self.scanlog.scanimages[image]
-            self.createh5dataset(data, metadata)
+    def convertscan2h5(self, nreaders=1, nwriters=1, skip_existing=False):
+        """
+        Converts all images of the scan. Reading and writing run in separate, bounded thread pools, so that reads
+        from the raw data filesystem overlap with the h5 writes.
+
+        :param nreaders: <int> (optional)
+            number of concurrent read threads (default: 1)
+        :param nwriters: <int> (optional)
+            number of concurrent write threads (default: 1)
+        :param skip_existing: <boolean> (optional)
+            skip images whose h5 file is newer than the raw image (default: False)
+
+        :return: <dict>
+            conversion statistics: nimages, nconverted, nskipped, nbytes, seconds, mb_per_s
+        """
+        mkdir(self.h5path)
+        imageinfo = self.scanlog['imageinfo']
+        todo = list()
+        for image in sorted(imageinfo):
+            metadata = imageinfo[image]
+            if skip_existing and self._is_converted(metadata):
+                continue
+            todo.append(metadata)
+
+        nbytes = [0]
+        lock = threading.Lock()
+        # bounds the number of images held in memory between read and write
+        inflight = threading.BoundedSemaphore(2 * (nreaders + nwriters))
+        t_start = time.time()
+
+        def write(data, metadata):
+            try:
+                self.createh5dataset(data, metadata)
+                with lock:
+                    nbytes[0] += data.nbytes
+            finally:
+                inflight.release()
+
+        with ThreadPoolExecutor(nwriters) as writers, ThreadPoolExecutor(nreaders) as readers:
+            def read(metadata):
+                try:
+                    data = read_dat(self.rawdatapath + metadata['imagename'])
+                except Exception:
+                    inflight.release()
+                    raise
+                return writers.submit(write, data, metadata)
+
+            read_futures = list()
+            for metadata in todo:
+                inflight.acquire()
+                read_futures.append(readers.submit(read, metadata))
+            # propagate exceptions of reads and writes
+            for future in read_futures:
+                future.result().result()
+
+        seconds = time.time() - t_start
+        stats = {'nimages': len(imageinfo), 'nconverted': len(todo), 'nskipped': len(imageinfo) - len(todo),
+                 'nbytes': nbytes[0], 'seconds': seconds,
+                 'mb_per_s': nbytes[0] / 1e6 / seconds if seconds > 0 else 0.0}
+        logger.info('converted {} ({} images, {} skipped) in {:.1f} s, {:.1f} MB/s'.format(
+            self.scanlogpath, stats['nconverted'], stats['nskipped'], seconds, stats['mb_per_s']))
+        return stats
 
     def createh5dataset(self, data, metadata):
-        try:
-            os.mkdir(self.h5path)
-        except OSError as exc:
-            if exc.errno == errno.EEXIST and os.path.isdir(self.h5path):
-                pass
-            else:
-                raise
         h5filename = metadata['imagename'].split('.')[0] + '.h5'
-        with h5py.File(self.h5path + h5filename, "w") as f:
+        # write to a temporary file first, so that an interrupted conversion never leaves a complete looking file
+        tmpname = self.h5path + h5filename + '.part'
+        with h5py.File(tmpname, "w") as f:
             h5dset = f.create_dataset(metadata['imagename'], (data.shape), data=data)
             for attribute in sorted(metadata):
-                if isinstance(metadata[attribute], datetime.datetime):
-                    metadata[attribute] = (metadata[attribute] - datetime.datetime(1970, 1, 1)).total_seconds()
-                if not metadata[attribute]:
-                    metadata[attribute] = 'nan'.encode('utf-8', errors='strict')
-                if isinstance(metadata[attribute], str):
-                    metadata[attribute] = metadata[attribute].encode('utf-8', errors='strict')
-                h5dset.attrs.create(attribute, metadata[attribute])
+                h5dset.attrs.create(attribute, _h5attribute(metadata[attribute]))
+        os.rename(tmpname, self.h5path + h5filename)
+
+    def _is_converted(self, metadata):
+        """
+        Checks if the h5 file of an image exists and is newer than the raw image.
+
+        :param metadata: <dict>
+            image information from the scanlog
+
+        :return: <boolean>
+        """
+        h5filename = self.h5path + metadata['imagename'].split('.')[0] + '.h5'
+        try:
+            return os.path.getmtime(h5filename) >= os.path.getmtime(self.rawdatapath + metadata['imagename'])
+        except OSError:
+            return False
+
+
+def _h5attribute(value):
+    """
+    Converts a scanlog value to a type that can be stored as h5 attribute. The input value is not modified.
+
+    :param value: <*>
+        value from the parsed scanlog
+
+    :return: <*>
+        value suitable for h5py attributes
+    """
+    if isinstance(value, datetime.datetime):
+        return (value - datetime.datetime(1970, 1, 1)).total_seconds()
+    if value is None or value == '':
+        return 'nan'.encode('utf-8', errors='strict')
+    if isinstance(value, str):
+        return value.encode('utf-8', errors='strict')
+    return value
+
+
+def batch_idl2h5(scanlogpaths, h5root, nreaders=4, nwriters=2, force=False):
+    """
+    Converts many scans to h5. Scanlogs can be found e.g. with p05tools.file.misc.find. The raw data is expected
+    next to the scanlog, the h5 files are written to h5root/<scanname>/. Completely converted scans are marked and
+    skipped, as long as their scanlog is unchanged. Interrupted scans are resumed image by image.
+
+    :param scanlogpaths: <list>
+        list of paths to scanlog files
+    :param h5root: <str>
+        folder in which one subfolder per scan is created
+    :param nreaders: <int> (optional)
+        number of concurrent read threads per scan (default: 4)
+    :param nwriters: <int> (optional)
+        number of concurrent write threads per scan (default: 2)
+    :param force: <boolean> (optional)
+        convert all images, even if they were converted before (default: False)
+
+    :return: <dict>
+        conversion statistics per scanlog path (see Idl2H5.convertscan2h5), None for skipped scans and
+        {'error': <repr of the exception>} for failed scans
+    """
+    results = dict()
+    for scanlogpath in sorted(scanlogpaths):
+        rawdatapath = os.path.dirname(os.path.abspath(scanlogpath)) + '/'
+        scanname = os.path.basename(os.path.dirname(rawdatapath))
+        h5path = os.path.join(h5root, scanname) + '/'
+        marker = h5path + _DONE_MARKER
+        scanlog_mtime = os.path.getmtime(scanlogpath)
+
+        if not force and os.path.isfile(marker):
+            with open(marker, 'r') as f:
+                if json.load(f).get('scanlog_mtime') == scanlog_mtime:
+                    logger.info('skip {}, already converted'.format(scanlogpath))
+                    results[scanlogpath] = None
+                    continue
+
+        try:
+            converter = Idl2H5(scanlogpath, rawdatapath, h5path)
+            stats = converter.convertscan2h5(nreaders, nwriters, skip_existing=not force)
+        except Exception as exc:
+            # a broken scan must not abort the conversion of all following scans
+            logger.error('conversion of {} failed: {!r}'.format(scanlogpath, exc))
+            results[scanlogpath] = {'error': repr(exc)}
+            continue
+        with open(marker, 'w') as f:
+            json.dump({'scanlog_mtime': scanlog_mtime, 'stats': stats}, f)
+        results[scanlogpath] = stats
+
+    return results
@@ -2,7 +2,7 @@ import numpy
 from io import open
 
 
-def _readfile(path, dtype, dimsize):
+def _readfile(path, dtype, dimsize, rows=None):
     """
     Helper routine for p05tools.file.read_dat. Reads out binary file
 
@@ -12,10 +12,20 @@ def _readfile(path, dtype, dimsize):
         numpy dtype of the data
     :param dimsize: <list>
         list of the data dimensions
+    :param rows: <int>, <list> or <slice> (optional)
+        rows of the (flipped) image to read. Reads the whole image if omitted.
 
     :return: <ndarray>
         Data from the file
     """
+    if rows is not None:
+        with open(path, 'rb') as f:
+            offset = len(f.readline())
+            # map the file and read only the requested rows, rows are counted after flipping
+            data = numpy.memmap(f, numpy.dtype(dtype), 'r', offset, shape=tuple(dimsize[::-1]))
+            data = numpy.array(data[::-1][rows])
+        return data
+
     with open(path, 'rb') as f:
         # Now seek forward until beginning of file or we get a \n
         # ch = 0
@@ -65,15 +75,17 @@ def _checkheader(path):
     return dtype, dimsize
 
 
-def read_dat(path):
+def read_dat(path, rows=None):
     """
     Load IDL tomo binary image data from file into a python ndarray.
 
     :param path: <str>
         Path to the data file
+    :param rows: <int>, <list> or <slice> (optional)
+        Read only these rows of the image (default: read all)
 
     :return: <ndarray>
         Data from the file
     """
     dtype, dimsize = _checkheader(path)
-    return _readfile(path, dtype, dimsize)
+    return _readfile(path, dtype, dimsize, rows)
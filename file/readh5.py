@@ -1,21 +1,33 @@
 import h5py
 import numpy
 
+def _read_rows(h5dset, rows):
+    """
+    Reads rows of a h5 dataset in the requested order. h5py needs increasing indices, so the unique sorted rows are
+    read and reordered afterwards. Scalars are read as a stack of one row.
+
+    :param h5dset: <h5py.Dataset>
+        dataset to read from
+    :param rows: <int>, <list>, <ndarray> or <slice>
+        rows to read
+
+    :return: <ndarray>
+    """
+    if isinstance(rows, slice):
+        return h5dset[rows]
+    unique_rows, inverse = numpy.unique(numpy.atleast_1d(rows), return_inverse=True)
+    return h5dset[unique_rows.tolist()][inverse.ravel()]
+
+
 def readh5(filepath, rows=None):
-    if rows:
-        if isinstance(rows, list):
-            rows = rows
-        else:
-            rows = [rows]
-    else:
-        rows = None
 
     with h5py.File(filepath, "r") as f:
         # This works only if there is only one dataset in the file. (First is taken, other are ignored).
         dsetname = list(f.keys())[0]
         h5dset = f.get(dsetname)
-        if rows:
-            data = numpy.array(h5dset)[rows]
+        if rows is not None:
+            # read only the requested rows from the file
+            data = _read_rows(h5dset, rows)
         else:
             data = numpy.array(h5dset)
         attrs_keys = h5dset.attrs.keys()
@@ -0,0 +1,120 @@
+import datetime
+import numpy
+
+
+# type codes of the images in a scan
+IMG, REF, DARK = 0, 1, 2
+_TYPECODES = {'img': IMG, 'ref': REF, 'dark': DARK}
+
+
+def _typecode(imagetype):
+    """
+    Converts an imagetype string from the scanlog (str or bytes) into a type code.
+
+    :param imagetype: <str> or <bytes>
+        imagetype as in the scanlog ('img', 'ref' or 'dark')
+
+    :return: <int>
+        IMG, REF, DARK or -1 for unknown types
+    """
+    if isinstance(imagetype, bytes):
+        imagetype = imagetype.decode('utf-8', errors='strict')
+    return _TYPECODES.get(imagetype, -1)
+
+
+def _seconds(timestamp):
+    """
+    Converts a datetime into seconds since 1970-01-01, None into nan.
+    """
+    if timestamp is None:
+        return numpy.nan
+    return (timestamp - datetime.datetime(1970, 1, 1)).total_seconds()
+
+
+class ScanIndex:
+    """
+    Index of all images of a scan, built once from the parsed scanlog. Image numbers, names, type codes, angles (in
+    radians) and timestamps are stored as aligned 1D ndarrays, sorted by image number. Projections, flats and darks
+    are selected with boolean masks, subsets of a scan are new ScanIndex instances.
+    """
+    def __init__(self, imagenumber, imagename, imagetype, theta, timestamp):
+        self.imagenumber = numpy.asarray(imagenumber)
+        self.imagename = numpy.asarray(imagename)
+        self.imagetype = numpy.asarray(imagetype, dtype=numpy.int8)
+        self.theta = numpy.asarray(theta, dtype=numpy.float32)
+        self.timestamp = numpy.asarray(timestamp, dtype=numpy.float64)
+
+    @classmethod
+    def from_scanlog(cls, scanlog_content):
+        """
+        Builds the index from the output of parse_scanlog.
+
+        :param scanlog_content: <dict>
+            content of the scanlog (output of parse_scanlog)
+
+        :return: <ScanIndex>
+        """
+        items = sorted(scanlog_content['imageinfo'].items())
+        angles = [numpy.nan if item['imageangle'] is None else float(item['imageangle']) for _, item in items]
+        return cls([item['imagenumber'] for _, item in items],
+                   [item['imagename'] for _, item in items],
+                   [_typecode(item['imagetype']) for _, item in items],
+                   numpy.deg2rad(numpy.asarray(angles, dtype=numpy.float64)),
+                   [_seconds(item['t0_ss']) for _, item in items])
+
+    def __len__(self):
+        return len(self.imagenumber)
+
+    @property
+    def proj_mask(self):
+        """
+        Mask of all projections with a valid angle.
+        """
+        return (self.imagetype == IMG) & numpy.isfinite(self.theta)
+
+    @property
+    def flat_mask(self):
+        """
+        Mask of all flat field images.
+        """
+        return self.imagetype == REF
+
+    @property
+    def dark_mask(self):
+        """
+        Mask of all dark field images.
+        """
+        return self.imagetype == DARK
+
+    def select(self, mask):
+        """
+        Returns a new index containing only the selected images.
+
+        :param mask: <ndarray>
+            boolean mask or integer indices into this index
+
+        :return: <ScanIndex>
+        """
+        return ScanIndex(self.imagenumber[mask], self.imagename[mask], self.imagetype[mask],
+                         self.theta[mask], self.timestamp[mask])
+
+    def filter(self, angle_range=None, every=None):
+        """
+        Selects a subset of the projections, flats and darks are kept.
+
+        :param angle_range: <tuple> (float, float) (optional)
+            keep only projections with angle_range[0] <= theta <= angle_range[1] (in radians)
+        :param every: <int> (optional)
+            keep only every nth of the (remaining) projections
+
+        :return: <ScanIndex>
+        """
+        proj_mask = self.proj_mask
+        if angle_range is not None:
+            with numpy.errstate(invalid='ignore'):
+                proj_mask &= (self.theta >= angle_range[0]) & (self.theta <= angle_range[1])
+        if every is not None and every > 1:
+            proj_positions = numpy.flatnonzero(proj_mask)
+            proj_mask[:] = False
+            proj_mask[proj_positions[::every]] = True
+        return self.select(proj_mask | self.flat_mask | self.dark_mask)
@@ -0,0 +1,260 @@
+from p05tools.file.read_dat import read_dat, _checkheader
+from p05tools.file.readh5 import readh5, _read_rows
+from p05tools.file.misc import mkdir
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import tempfile
+import hashlib
+import logging
+import numpy
+import h5py
+import os
+
+
+logger = logging.getLogger('reco_logger')
+
+GPFS_BASEPATH = '/asap3/petra3/gpfs/p05/'
+
+
+def gpfs_paths(scanname, foldername=None, year=None, application_number=None, commissioning=None,
+               basepath=GPFS_BASEPATH):
+    """
+    Builds the paths to raw and processed data of a scan on the gpfs filesystem of the DESY Maxwell-core cluster.
+
+    :param scanname: <string>
+        name on the scan (defined by raw data)
+    :param foldername: <string> (optional)
+        name of folder, where the processed data should go. Omitting foldername
+        will set the foldername to the scanname
+    :param year: <int>
+        year in which the raw data was taken
+    :param application_number: <int> or <None>
+        application number of the beamtime in which the scan was taken (set None if commissioning beamtime)
+    :param commissioning: <string> or <None>
+        Name of the commissioning beamtime (set None if regular beamtime)
+    :param basepath: <string> (optional)
+        root of the beamline data (default: GPFS_BASEPATH)
+
+    :return: <tuple> (string, string)
+        raw_dir, reco_dir
+    """
+    beamtime_dir = None
+    if application_number:
+        beamtime_dir = os.path.join(basepath, str(year), 'data', str(application_number))
+    if commissioning:
+        beamtime_dir = os.path.join(basepath, str(year), 'commissioning', commissioning)
+    if beamtime_dir is None:
+        return None, None
+
+    raw_dir = os.path.join(beamtime_dir, 'raw', scanname) + '/'
+    reco_dir = os.path.join(beamtime_dir, 'processed', foldername or scanname) + '/'
+    return raw_dir, reco_dir
+
+
+class DatStorage:
+    """
+    Raw IDL images (.img, .ref, .dar) of one scan in a folder of a POSIX filesystem. All backends provide
+    read(imagename, rows) and shape(imagename).
+    """
+    def __init__(self, raw_dir):
+        self.raw_dir = raw_dir
+        self.key = raw_dir
+
+    def read(self, imagename, rows=None):
+        """
+        Reads one image.
+
+        :param imagename: <str>
+            name of the image as in the scanlog
+        :param rows: <list> or <slice> (optional)
+            read only these rows of the image
+
+        :return: <ndarray>
+        """
+        return read_dat(self.raw_dir + imagename, rows)
+
+    def shape(self, imagename):
+        """
+        Shape of one image, read from the file header.
+        """
+        _, dimsize = _checkheader(self.raw_dir + imagename)
+        return tuple(dimsize[::-1])
+
+
+class GpfsStorage(DatStorage):
+    """
+    Raw data of a scan on the beamline gpfs filesystem.
+    """
+    def __init__(self, scanname, year, application_number=None, commissioning=None, basepath=GPFS_BASEPATH):
+        raw_dir, _ = gpfs_paths(scanname, year=year, application_number=application_number,
+                                commissioning=commissioning, basepath=basepath)
+        DatStorage.__init__(self, raw_dir)
+
+
+class ScratchStorage(DatStorage):
+    """
+    Copy of the raw data of a scan on local scratch, in scratch_dir/<scanname>/.
+    """
+    def __init__(self, scanname, scratch_dir):
+        DatStorage.__init__(self, os.path.join(scratch_dir, scanname) + '/')
+
+
+class H5Storage:
+    """
+    Scan converted to h5. h5path is either a folder with one h5 file per image as written by Idl2H5, or a single
+    consolidated h5 file with one dataset per image, named by the imagename.
+    """
+    def __init__(self, h5path):
+        self.h5path = h5path
+        self.key = h5path
+        self.consolidated = os.path.isfile(h5path)
+
+    def read(self, imagename, rows=None):
+        """
+        Reads one image.
+
+        :param imagename: <str>
+            name of the image as in the scanlog
+        :param rows: <list> or <slice> (optional)
+            read only these rows of the image
+
+        :return: <ndarray>
+        """
+        if self.consolidated:
+            with h5py.File(self.h5path, 'r') as f:
+                h5dset = f[imagename]
+                return h5dset[()] if rows is None else _read_rows(h5dset, rows)
+        data, _ = readh5(self._filename(imagename), rows)
+        return data
+
+    def shape(self, imagename):
+        """
+        Shape of one image, read from the dataset metadata.
+        """
+        if self.consolidated:
+            with h5py.File(self.h5path, 'r') as f:
+                return f[imagename].shape
+        with h5py.File(self._filename(imagename), 'r') as f:
+            return f[list(f.keys())[0]].shape
+
+    def _filename(self, imagename):
+        return os.path.join(self.h5path, imagename.split('.')[0] + '.h5')
+
+
+class CachedStorage:
+    """
+    Caches the images of another storage backend on node-local scratch. Images are staged on first access (or in
+    advance with stage()) and stored as .npy files in cache_dir/<hash of the backend>/. If the cache grows beyond
+    max_bytes, the least recently used images are removed down to low_water * max_bytes. The cache directory can be
+    shared by several scans and processes.
+    """
+    def __init__(self, backend, cache_dir, max_bytes=100e9, low_water=0.9):
+        self.backend = backend
+        self.key = backend.key
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.scan_dir = os.path.join(cache_dir, hashlib.md5(backend.key.encode('utf-8')).hexdigest()[:16])
+        mkdir(self.scan_dir)
+        # estimate of the cache size, updated on staging and recomputed on eviction
+        self._cache_bytes = None
+        self._lock = threading.Lock()
+
+    def read(self, imagename, rows=None):
+        """
+        Reads one image from the cache, stages it first if necessary.
+
+        :param imagename: <str>
+            name of the image as in the scanlog
+        :param rows: <list> or <slice> (optional)
+            read only these rows of the image
+
+        :return: <ndarray>
+        """
+        cachefile = self._stage_one(imagename)
+        data = numpy.load(cachefile, mmap_mode='r')
+        return numpy.array(data if rows is None else data[rows])
+
+    def shape(self, imagename):
+        """
+        Shape of one image, from the cache if it is staged, from the backend otherwise.
+        """
+        cachefile = os.path.join(self.scan_dir, imagename + '.npy')
+        if os.path.isfile(cachefile):
+            return numpy.load(cachefile, mmap_mode='r').shape
+        return self.backend.shape(imagename)
+
+    def stage(self, imagenames, nthreads=4):
+        """
+        Copies images to the cache in advance.
+
+        :param imagenames: <list>
+            names of the images, e.g. ScanIndex.imagename
+        :param nthreads: <int> (optional)
+            number of concurrent copies (default: 4)
+        """
+        with ThreadPoolExecutor(nthreads) as pool:
+            list(pool.map(self._stage_one, imagenames))
+
+    def _stage_one(self, imagename):
+        """
+        Returns the path of the cached image, copies the image to the cache if it is missing.
+        """
+        cachefile = os.path.join(self.scan_dir, imagename + '.npy')
+        if os.path.isfile(cachefile):
+            # the modification time is used as last access time for the LRU eviction
+            os.utime(cachefile, None)
+            return cachefile
+
+        data = self.backend.read(imagename)
+        # unique temporary name, several threads or processes may stage the same image at the same time
+        fd, tmpname = tempfile.mkstemp(suffix='.part.npy', dir=self.scan_dir)
+        with os.fdopen(fd, 'wb') as f:
+            numpy.save(f, data)
+        try:
+            os.rename(tmpname, cachefile)
+        except OSError:
+            os.remove(tmpname)
+            if not os.path.isfile(cachefile):
+                raise
+            # staged concurrently by another writer
+            return cachefile
+        logger.debug('staged {} to {}'.format(imagename, cachefile))
+        size = os.path.getsize(cachefile)
+        with self._lock:
+            if self._cache_bytes is None or self._cache_bytes + size > self.max_bytes:
+                self._evict(keep=cachefile)
+            else:
+                self._cache_bytes += size
+        return cachefile
+
+    def _evict(self, keep=None):
+        """
+        Removes least recently used images until the cache is smaller than low_water * max_bytes, so that the cache
+        is not scanned again for every following image.
+        """
+        entries = list()
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith('.npy') or filename.endswith('.part.npy'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.low_water * self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            logger.debug('evicted {} from cache'.format(path))
+        self._cache_bytes = total
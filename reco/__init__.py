@@ -7,20 +7,38 @@ from p05tools.reco.recotools import rebin_stack
 from p05tools.reco.recotools import get_paths
 from p05tools.reco.recotools import get_rawdata
 from p05tools.reco.recotools import get_metadata
+from p05tools.reco.recotools import load_sinogram
+from p05tools.reco.recotools import preview_reconstruct
 from p05tools.reco.recotools import correrlate_flat
 from p05tools.reco.recotools import normalize_corr
+from p05tools.reco.recotools import retrieve_phase
+from p05tools.reco.recotools import phase_params_from_overview
+from p05tools.reco.recotools import remove_stripes
 from p05tools.reco.recotools import chunk_reconstruct
+from p05tools.reco.recotools import find_center
 from p05tools.reco.recotools import init_filelog
+from p05tools.reco.output import H5VolumeWriter, TiffStackWriter, open_writer
+from p05tools.reco.checkpoint import RecoCheckpoint
 # from p05tools.reco.findoverlap import findOverlap
 
 __all__ = ['rebin_stack',
            'getpaths'
            'get_metadata',
            'get_rawdata',
+           'load_sinogram',
+           'preview_reconstruct',
            'correrlate_flat',
            'normalize_corr',
+           'retrieve_phase',
+           'phase_params_from_overview',
+           'remove_stripes',
            'chunk_reconstruct',
+           'find_center',
            'TomopyWrapper',
-           'init_filelog'
+           'init_filelog',
+           'H5VolumeWriter',
+           'TiffStackWriter',
+           'open_writer',
+           'RecoCheckpoint'
            #'findoverlap'
            ]
\ No newline at end of file
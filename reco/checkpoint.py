@@ -0,0 +1,247 @@
+import numpy
+import logging
+import hashlib
+import json
+import shutil
+import os
+from p05tools.file.misc import mkdir
+
+
+logger = logging.getLogger('reco_logger')
+
+
+def _describe(value):
+    """
+    Short human readable description of a parameter value for the manifest.
+    """
+    if isinstance(value, numpy.ndarray):
+        return 'ndarray {} {}'.format(value.dtype, value.shape)
+    return repr(value)
+
+
+def _fingerprint(params, parent=''):
+    """
+    Hash of the parameters of a stage, chained to the fingerprint of the previous stage.
+
+    :param params: <dict>
+        parameters of the stage, ndarrays are hashed by content
+    :param parent: <str> (optional)
+        fingerprint of the previous stage
+
+    :return: <str>
+    """
+    sha = hashlib.sha1(parent.encode('utf-8'))
+    for key in sorted(params):
+        value = params[key]
+        sha.update(str(key).encode('utf-8'))
+        if isinstance(value, numpy.ndarray):
+            sha.update(_describe(value).encode('utf-8'))
+            sha.update(numpy.ascontiguousarray(value).tobytes())
+        else:
+            sha.update(repr(value).encode('utf-8'))
+    return sha.hexdigest()
+
+
+# order of the stages of a reconstruction run, each stage is chained to the stored stage before it
+STAGES = ('flat_with_min', 'normalized', 'phase', 'reconstruction')
+
+
+class RecoCheckpoint:
+    """
+    Checkpoints of a reconstruction run in reco_dir/checkpoint/, next to reco.log. Each stage (see STAGES) stores its
+    result as a whole or in blocks (.npy files), a manifest.json records the parameters and finished blocks of every
+    stage.
+
+    The fingerprint of a stage hashes its parameters together with the stored fingerprint of the preceding stage in
+    STAGES (skipping stages that were never run). It does not depend on the order or number of calls, so repeated
+    calls reuse the stored results. Changing a parameter discards the results of this stage and of all following
+    stages, while earlier stages are reused. If a pipeline no longer uses the phase stage, remove it with
+    discard('phase'). The checkpoint does not know the raw data; use one reco_dir per scan.
+
+    The parameters of the stages are
+        * flat_with_min: {'proj_shape': proj.shape, 'flat_shape': flat.shape}
+        * normalized: {'cutoff': ..., 'zinger_threshold': ..., 'blocksize': ...} as passed to normalize_corr
+        * phase: {'pixel_size': ..., 'delta_beta': ..., 'dist': ..., 'energy': ..., 'blocksize': ..., 'pad': ...}
+          as used by retrieve_phase
+        * reconstruction: arguments of chunk_reconstruct
+
+    A rerun can start after a completed stage without its inputs (e.g. without reading the raw data):
+
+        checkpoint = RecoCheckpoint(reco_dir)
+        proj = checkpoint.load_stage('normalized', {'cutoff': 1.5, 'zinger_threshold': None, 'blocksize': 32})
+        if proj is None:
+            proj, flat, dark, theta = get_rawdata(...)
+            ...
+        rec = chunk_reconstruct(chunksize, proj, theta, checkpoint=checkpoint, ...)
+    """
+    def __init__(self, reco_dir, name='checkpoint'):
+        self.directory = os.path.join(reco_dir, name)
+        mkdir(self.directory)
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self.manifest = {'stages': {}}
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+
+    def fingerprint(self, stage, params):
+        """
+        Fingerprint of a stage with the given parameters, chained to the stored preceding stage.
+
+        :param stage: <str>
+            name of the stage, one of STAGES
+        :param params: <dict>
+            all parameters the result of the stage depends on
+
+        :return: <str>
+        """
+        parent = ''
+        for previous in reversed(STAGES[:STAGES.index(stage)]):
+            if previous in self.manifest['stages']:
+                parent = self.manifest['stages'][previous]['fingerprint']
+                break
+        return _fingerprint(params, parent)
+
+    def begin(self, stage, params):
+        """
+        Declares a stage and its parameters. Results of the stage are kept if its parameters and the preceding stage
+        are unchanged, otherwise they are discarded together with the results of all following stages.
+
+        :param stage: <str>
+            name of the stage, one of STAGES
+        :param params: <dict>
+            all parameters the result of the stage depends on
+        """
+        fingerprint = self.fingerprint(stage, params)
+        entry = self.manifest['stages'].get(stage)
+        if entry is not None and entry['fingerprint'] == fingerprint:
+            logger.info('checkpoint: resume stage {} ({} blocks done)'.format(stage, len(entry['blocks'])))
+            return
+        if entry is not None:
+            logger.info('checkpoint: parameters of stage {} changed, discard results'.format(stage))
+        for following in STAGES[STAGES.index(stage):]:
+            self.discard(following)
+        mkdir(self._stagedir(stage))
+        self.manifest['stages'][stage] = {'fingerprint': fingerprint, 'blocks': [], 'complete': False,
+                                          'params': dict((key, _describe(value)) for key, value in params.items())}
+        self._write_manifest()
+
+    def discard(self, stage):
+        """
+        Removes the stored results of a stage.
+
+        :param stage: <str>
+            name of the stage
+        """
+        shutil.rmtree(self._stagedir(stage), ignore_errors=True)
+        if self.manifest['stages'].pop(stage, None) is not None:
+            self._write_manifest()
+
+    def finish(self, stage):
+        """
+        Marks a stage as complete, i.e. all its blocks are stored.
+
+        :param stage: <str>
+            name of the stage
+        """
+        self.manifest['stages'][stage]['complete'] = True
+        self._write_manifest()
+
+    def complete(self, stage, params):
+        """
+        Checks if a stage was completed with the given parameters and the stored preceding stages.
+
+        :param stage: <str>
+            name of the stage
+        :param params: <dict>
+            parameters of the stage
+
+        :return: <boolean>
+        """
+        entry = self.manifest['stages'].get(stage)
+        return (entry is not None and entry.get('complete', False) and
+                entry['fingerprint'] == self.fingerprint(stage, params))
+
+    def load_stage(self, stage, params):
+        """
+        Loads the complete result of a stage, blocks are assembled along the first axis.
+
+        :param stage: <str>
+            name of the stage
+        :param params: <dict>
+            parameters of the stage
+
+        :return: <ndarray> or None
+            result of the stage, None if the stage is not complete or was computed with other parameters
+        """
+        if not self.complete(stage, params):
+            logger.info('checkpoint: no completed stage {} with these parameters'.format(stage))
+            return None
+        blocks = sorted(self.manifest['stages'][stage]['blocks'])
+        if blocks == ['all']:
+            return self.load(stage)
+
+        parts = [numpy.load(self._filename(stage, int(block)), mmap_mode='r') for block in blocks]
+        data = numpy.empty((sum(part.shape[0] for part in parts),) + parts[0].shape[1:], dtype=parts[0].dtype)
+        a = 0
+        for part in parts:
+            data[a:a + part.shape[0]] = part
+            a += part.shape[0]
+        logger.info('checkpoint: loaded completed stage {}'.format(stage))
+        return data
+
+    def has(self, stage, index=None):
+        """
+        Checks if the result (or block index) of a stage is stored.
+
+        :param stage: <str>
+            name of the stage
+        :param index: <int> (optional)
+            block index, omit for stages stored as a whole
+        """
+        entry = self.manifest['stages'].get(stage)
+        return entry is not None and self._blockname(index) in entry['blocks']
+
+    def save(self, stage, data, index=None):
+        """
+        Stores the result (or block index) of a stage.
+
+        :param stage: <str>
+            name of the stage
+        :param data: <ndarray>
+            result
+        :param index: <int> (optional)
+            block index, omit for stages stored as a whole
+        """
+        filename = self._filename(stage, index)
+        numpy.save(filename + '.part.npy', data)
+        os.rename(filename + '.part.npy', filename)
+        self.manifest['stages'][stage]['blocks'].append(self._blockname(index))
+        self._write_manifest()
+
+    def load(self, stage, index=None):
+        """
+        Loads the result (or block index) of a stage.
+
+        :param stage: <str>
+            name of the stage
+        :param index: <int> (optional)
+            block index, omit for stages stored as a whole
+
+        :return: <ndarray>
+        """
+        return numpy.load(self._filename(stage, index))
+
+    @staticmethod
+    def _blockname(index):
+        return 'all' if index is None else '{:06d}'.format(index)
+
+    def _stagedir(self, stage):
+        return os.path.join(self.directory, stage)
+
+    def _filename(self, stage, index):
+        return os.path.join(self._stagedir(stage), self._blockname(index) + '.npy')
+
+    def _write_manifest(self):
+        with open(self.manifest_path + '.part', 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.rename(self.manifest_path + '.part', self.manifest_path)
@@ -0,0 +1,166 @@
+import numpy
+import logging
+import h5py
+import os
+from p05tools.file.misc import mkdir
+from p05tools.reco.recotools import rebin_stack
+
+
+logger = logging.getLogger('reco_logger')
+
+
+class _VolumeWriter:
+    """
+    Base class of the volume writers. Receives reconstructed slabs (slices, rows, columns) as they are finished and
+    writes them incrementally. Optionally, downsampled pyramid levels (binned by 2 per level in all dimensions) are
+    built at the same time; this requires the slabs to arrive in order of the slices. Subclasses implement _create
+    and _write_level.
+    """
+    def __init__(self, nslices, levels=1):
+        if levels < 1 or nslices >> (levels - 1) == 0:
+            raise ValueError('{} levels need at least {} slices, got {}'.format(levels, 2 ** (levels - 1), nslices))
+        self.nslices = nslices
+        self.levels = levels
+        self.shapes = None
+        # slices of each pyramid level waiting for their binning partner, and the next slice to write per level
+        self._pending = [None] * levels
+        self._next = [0] * levels
+
+    def write(self, slab, start):
+        """
+        Writes reconstructed slices.
+
+        :param slab: <ndarray>
+            3D array of reconstructed slices
+        :param start: <int>
+            index of the first slice of slab in the volume
+        """
+        if self.shapes is None:
+            if min(slab.shape[1:]) >> (self.levels - 1) == 0:
+                raise ValueError('{} levels need slices of at least {} pixels, got {}'.format(
+                    self.levels, 2 ** (self.levels - 1), slab.shape[1:]))
+            self.shapes = [(self.nslices >> level, slab.shape[1] >> level, slab.shape[2] >> level)
+                           for level in range(self.levels)]
+            self._create()
+        if self.levels > 1 and start != self._next[0]:
+            raise ValueError('pyramid levels require slabs in order, expected slice {}, got {}'.format(
+                self._next[0], start))
+        self._write_level(0, slab, start)
+        self._next[0] = start + slab.shape[0]
+        self._push(1, slab)
+
+    def _push(self, level, slab):
+        """
+        Bins slices of the previous level by 2 and writes them to level.
+        """
+        if level >= self.levels:
+            return
+        if self._pending[level] is not None:
+            slab = numpy.concatenate((self._pending[level], slab))
+        npairs = slab.shape[0] // 2
+        self._pending[level] = slab[2 * npairs:]
+        if npairs == 0:
+            return
+        binned = rebin_stack(slab[:2 * npairs], 2, 'level {}'.format(level))
+        binned = binned.reshape((npairs, 2) + binned.shape[1:]).mean(1).astype(numpy.float32)
+        binned = binned[:, :self.shapes[level][1], :self.shapes[level][2]]
+        self._write_level(level, binned, self._next[level])
+        self._next[level] += npairs
+        self._push(level + 1, binned)
+
+    def close(self):
+        """
+        Finishes writing. Unpaired slices at the end of the volume are dropped from the pyramid levels.
+        """
+        self._pending = [None] * self.levels
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class H5VolumeWriter(_VolumeWriter):
+    """
+    Writes a volume to a chunked, compressed h5 file. The full resolution volume is stored in dataset 'level0', the
+    pyramid levels in 'level1', 'level2', ... with the binning factor as attribute 'binning'.
+    """
+    def __init__(self, filename, nslices, levels=1, chunks=None, compression='gzip', compression_opts=4):
+        _VolumeWriter.__init__(self, nslices, levels)
+        self.filename = filename
+        self.chunks = chunks
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.file = None
+
+    def _create(self):
+        self.file = h5py.File(self.filename, 'w')
+        for level, shape in enumerate(self.shapes):
+            chunks = self.chunks or (min(16, shape[0]), min(256, shape[1]), min(256, shape[2]))
+            dset = self.file.create_dataset('level{}'.format(level), shape, dtype=numpy.float32, chunks=chunks,
+                                            compression=self.compression, compression_opts=self.compression_opts)
+            dset.attrs.create('binning', 2 ** level)
+
+    def _write_level(self, level, slab, start):
+        stop = min(start + slab.shape[0], self.shapes[level][0])
+        if stop > start:
+            self.file['level{}'.format(level)][start:stop] = slab[:stop - start]
+
+    def close(self):
+        _VolumeWriter.close(self)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            logger.info('wrote volume {}'.format(self.filename))
+
+
+class TiffStackWriter(_VolumeWriter):
+    """
+    Writes a volume as one tiff file per slice to directory/level0/, the pyramid levels to directory/level1/, ...
+    Requires the tifffile package.
+    """
+    def __init__(self, directory, nslices, levels=1, prefix='reco_'):
+        _VolumeWriter.__init__(self, nslices, levels)
+        self.directory = directory
+        self.prefix = prefix
+
+    def _create(self):
+        for level in range(self.levels):
+            mkdir(os.path.join(self.directory, 'level{}'.format(level)))
+
+    def _write_level(self, level, slab, start):
+        import tifffile
+
+        for i, single_slice in enumerate(slab[:max(0, self.shapes[level][0] - start)]):
+            tifffile.imwrite(os.path.join(self.directory, 'level{}'.format(level),
+                                          '{}{:05d}.tif'.format(self.prefix, start + i)),
+                             numpy.asarray(single_slice, dtype=numpy.float32))
+
+
+def open_writer(reco_dir, nslices, fmt='h5', levels=1, name='reco', **kwargs):
+    """
+    Creates a volume writer in the reconstruction folder (e.g. reco_dir of get_paths), to be passed to
+    chunk_reconstruct.
+
+    :param reco_dir: <str>
+        path to the reconstruction folder
+    :param nslices: <int>
+        number of slices of the volume
+    :param fmt: <str> (optional)
+        'h5' for reco_dir/<name>.h5 or 'tiff' for reco_dir/<name>/level<n>/ (default: 'h5')
+    :param levels: <int> (optional)
+        number of resolution levels including full resolution (default: 1)
+    :param name: <str> (optional)
+        name of the h5 file or tiff folder (default: 'reco')
+    :param kwargs: <**>
+        further kwargs of H5VolumeWriter or TiffStackWriter
+
+    :return: <H5VolumeWriter> or <TiffStackWriter>
+    """
+    mkdir(reco_dir)
+    if fmt == 'h5':
+        return H5VolumeWriter(os.path.join(reco_dir, name + '.h5'), nslices, levels, **kwargs)
+    if fmt == 'tiff':
+        return TiffStackWriter(os.path.join(reco_dir, name), nslices, levels, **kwargs)
+    raise ValueError('unknown output format: {}'.format(fmt))
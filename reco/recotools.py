@@ -3,7 +3,9 @@ import numpy
 import logging
 from datetime import date
 import sys
-from p05tools.file import read_dat
+from collections import OrderedDict
+from p05tools.file.storage import DatStorage, GPFS_BASEPATH, gpfs_paths
+from p05tools.file.scanindex import ScanIndex
 
 
 logger = logging.getLogger('reco_logger')
@@ -13,6 +15,19 @@ logging_sh.setLevel(logging.DEBUG)
 logging_sh.setFormatter(formatter)
 logger.addHandler(logging_sh)
 
+# most recently loaded sinograms of load_sinogram
+_SINOGRAM_CACHE_SIZE = 4
+_sinogram_cache = OrderedDict()
+# rows (binned) loaded above and below each slice of load_sinogram for the flat matching
+_FLAT_MATCH_MARGIN = 8
+
+# Paganin filter kernels of retrieve_phase
+_paganin_kernel_cache = dict()
+
+# keys (lower case) of energy and sample-detector distance in the scanlog overview
+PHASE_ENERGY_KEYS = ['energy', 'beam_energy']
+PHASE_DISTANCE_KEYS = ['sample_detector_distance', 'camera_distance', 'detector_distance', 'distance']
+
 def rebin_stack(arr, factor, descriptor=''):
     """
     Binning of the 2nd and 3rd dimension of a 3d array
@@ -45,13 +60,14 @@ def _chunk_list(listobj, chunksize):
         chunked list
     """
     split_list = list()
-    nchunks = len(listobj) // chunksize + 1
+    nchunks = (len(listobj) + chunksize - 1) // chunksize
     for i in range(nchunks):
         split_list.append(listobj[i * chunksize:(i + 1) * chunksize])
     return split_list
 
 
-def get_paths(scanname, foldername=None, year=date.today().year, application_number=None, commissioning=None):
+def get_paths(scanname, foldername=None, year=date.today().year, application_number=None, commissioning=None,
+              basepath=GPFS_BASEPATH):
     """
     Function to build filepaths to rawdata and processed data. This function works for the gpfs filesystem of the 
     DESY Maxwell-core cluster. Returns paths to raw an processed data as strings.
@@ -67,26 +83,14 @@ def get_paths(scanname, foldername=None, year=date.today().year, application_num
         application number of the beamtime in which the scan was taken (set None if commissioning beamtime)
     :param commissioning: <string> or <None>
         Name of the commissioning beamtime (set None if regular beamtime)
+    :param basepath: <string> (optional)
+        root of the beamline data (default: GPFS_BASEPATH)
 
     :return: <tuple> (string, string)
         raw_dir, reco_dir
     """
 
-    basepath = '/asap3/petra3/gpfs/p05/' + str(year) + '/'
-    reco_dir, raw_dir = None, None
-
-    if application_number:
-        raw_dir = basepath + 'data/' + str(application_number) + '/raw/' + scanname + '/'
-        if foldername:
-            reco_dir = basepath + 'data/' + str(application_number) + '/processed/' + foldername + '/'
-        else:
-            reco_dir = basepath + 'data/' + str(application_number) + '/processed/' + scanname + '/'
-    if commissioning:
-        raw_dir = basepath + 'commissioning/' + commissioning + '/raw/' + scanname + '/'
-        if foldername:
-            reco_dir = basepath + 'commissioning/' + commissioning + '/processed/' + foldername + '/'
-        else:
-            reco_dir = basepath + 'commissioning/' + commissioning + '/processed/' + scanname + '/'
+    raw_dir, reco_dir = gpfs_paths(scanname, foldername, year, application_number, commissioning, basepath)
 
     logger.info('raw_dir : %s' % raw_dir)
     logger.info('reco_dir : %s' % reco_dir)
@@ -94,50 +98,54 @@ def get_paths(scanname, foldername=None, year=date.today().year, application_num
     return raw_dir, reco_dir
 
 
-def get_rawdata(scanlog_content, raw_dir, verbose=False):
+def get_rawdata(scanlog_content, raw_dir, verbose=False, scanindex=None, rows=None):
     """
-    Load raw data from gpfs filesystem in to python variables.
+    Load raw data from gpfs filesystem (or another storage backend) in to python variables.
 
     :param scanlog_content: <dict>
         content of the scanlog (output of parse_scanlog)
-    :param raw_dir: <string>
-        path to the raw data
+    :param raw_dir: <string> or storage backend
+        path to the raw data or a storage backend from p05tools.file.storage
     :param verbose: <boolean> (optional)
         print progress in percent if True (default: False)
+    :param scanindex: <ScanIndex> (optional)
+        (filtered) index of the images to load. Built from scanlog_content if omitted.
+    :param rows: <list> or <slice> (optional)
+        load only these detector rows (default: load full images)
 
     :return: <tuple> (3D ndarray,  3D ndarray, 3D ndarray, 1D ndarray)
         proj, flat, dark, as 3D uint16 ndarrays
         theta as 3D float32 array
     """
 
-    imageinfo = scanlog_content['imageinfo']
+    if scanindex is None:
+        scanindex = ScanIndex.from_scanlog(scanlog_content)
+    storage = raw_dir if hasattr(raw_dir, 'read') else DatStorage(raw_dir)
     counter = float(0)
     projlist, flatlist, darklist = list(), list(), list()
-    proj_metadata = list()
- 
-    for image_number, logcontent in sorted(imageinfo.items()):
+    proj_mask, flat_mask, dark_mask = scanindex.proj_mask, scanindex.flat_mask, scanindex.dark_mask
+
+    for i, imagename in enumerate(scanindex.imagename):
+        if not (proj_mask[i] or flat_mask[i] or dark_mask[i]):
+            continue
         if verbose:
             counter += 1
-            sys.stdout.write('\r%4.1f%% done. Reading file: %s\n' % (100 * counter/len(imageinfo.items()),
-                                                                   logcontent['imagename']))
-        data = read_dat(raw_dir + logcontent['imagename'])
-        if logcontent['imagetype'] == 'img':
-            if logcontent['imageangle'] != 'nan':
-                projlist.append(data)
-                proj_metadata.append(logcontent)
-        if logcontent['imagetype'] == 'ref':
+            sys.stdout.write('\r%4.1f%% done. Reading file: %s\n' % (100 * counter/len(scanindex), imagename))
+        data = storage.read(imagename, rows)
+        if proj_mask[i]:
+            projlist.append(data)
+        elif flat_mask[i]:
             flatlist.append(data)
-        if logcontent['imagetype'] == 'dark':
+        else:
             darklist.append(data)
-        logging.info(' read file %s.' % logcontent['imagename'])
+        logging.info(' read file %s.' % imagename)
     if verbose:
         sys.stdout.write('\n')
 
     proj = numpy.asarray(projlist, dtype=numpy.uint16)
     flat = numpy.asarray(flatlist, dtype=numpy.uint16)
     dark = numpy.asarray(darklist, dtype=numpy.uint16)
-    theta = numpy.asarray([float(item['imageangle']) * numpy.pi / 180.0 for item in proj_metadata],
-                          dtype=numpy.float32)
+    theta = scanindex.theta[proj_mask]
 
     logger.info('loaded raw data proj with shape: %s' % str(proj.shape))
     logger.info('loaded raw data flat with shape: %s' % str(flat.shape))
@@ -147,33 +155,153 @@ def get_rawdata(scanlog_content, raw_dir, verbose=False):
     return proj, flat, dark, theta
 
 
-def get_metadata(scanlog_content):
+def get_metadata(scanlog_content, scanindex=None):
     """
     Creates lists with metadata corresponding to the proj, flat and dark arrays.
 
     :param scanlog_content: <dict>
         content of the scanlog (output of parse_scanlog)
+    :param scanindex: <ScanIndex> (optional)
+        (filtered) index of the images, as passed to get_rawdata. Built from scanlog_content if omitted.
 
     :return: <tuple> (list, list, list)
         proj_metadata, flat_metadata, dark_metadata
     """
 
-    scanimages = scanlog_content['scanimages']
-    proj_metadata, flat_metadata, dark_metadata = list(), list(), list()
+    imageinfo = scanlog_content['imageinfo']
+    if scanindex is None:
+        scanindex = ScanIndex.from_scanlog(scanlog_content)
 
-    for logcontent in sorted(scanimages.items()):
-        if logcontent['imagetype'].decode('utf-8', errors='strict') == 'img':
-            if logcontent['imageangle'] != 'nan':
-                proj_metadata.append(logcontent)
-        if logcontent['imagetype'].decode('utf-8', errors='strict') == 'ref':
-            flat_metadata.append(logcontent)
-        if logcontent['imagetype'].decode('utf-8', errors='strict') == 'dark':
-            dark_metadata.append(logcontent)
+    proj_metadata = [imageinfo[number] for number in scanindex.imagenumber[scanindex.proj_mask]]
+    flat_metadata = [imageinfo[number] for number in scanindex.imagenumber[scanindex.flat_mask]]
+    dark_metadata = [imageinfo[number] for number in scanindex.imagenumber[scanindex.dark_mask]]
 
     return proj_metadata, flat_metadata, dark_metadata
 
 
-def correrlate_flat(proj, flat, verbose=False):
+def load_sinogram(scanlog_content, raw_dir, slices, every=1, binning=1, cutoff=None, ncore=None):
+    """
+    Loads, bins and normalizes the detector rows of the requested slices and applies the negative logarithm. Only
+    every nth projection is read. The flats are matched on a band of rows around the slices, only the requested
+    rows are kept. The result is cached, so that repeated calls with the same arguments (e.g. from
+    preview_reconstruct or find_center) do not read the raw data again. The returned arrays are read-only; copy them
+    before in-place processing (e.g. remove_stripes).
+
+    :param scanlog_content: <dict>
+        content of the scanlog (output of parse_scanlog)
+    :param raw_dir: <string> or storage backend
+        path to the raw data or a storage backend from p05tools.file.storage
+    :param slices: <list>
+        slices (detector rows, unbinned) to load
+    :param every: <int> (optional)
+        use only every nth projection (default: 1)
+    :param binning: <int> (optional)
+        binning factor of the detector (default: 1)
+    :param cutoff: <float> (optional)
+        Permitted maximum vaue for the normalized data
+    :param ncore: <int> (optional)
+        Number of cores that will be assigned to jobs
+
+    :return: <tuple> (3D ndarray, 1D ndarray, 1D ndarray)
+        proj (normalized, -log), theta and the unbinned slice numbers. Binned slice k covers the unbinned detector
+        rows slices[k] to slices[k] + binning - 1.
+    """
+    slices = numpy.unique(numpy.asarray(slices, dtype=numpy.int64) // binning) * binning
+    cachekey = (getattr(raw_dir, 'key', raw_dir), tuple(slices), every, binning, cutoff)
+    if cachekey in _sinogram_cache:
+        _sinogram_cache.move_to_end(cachekey)
+        return _sinogram_cache[cachekey]
+
+    scanindex = ScanIndex.from_scanlog(scanlog_content).filter(every=every)
+    storage = raw_dir if hasattr(raw_dir, 'read') else DatStorage(raw_dir)
+    flatnames = scanindex.imagename[scanindex.flat_mask]
+    if len(flatnames) == 0:
+        raise ValueError('no flat field images in the scan')
+    nrows = storage.shape(flatnames[0])[0]
+    if slices.min() < 0 or slices.max() + binning > nrows:
+        raise ValueError('slices must be between 0 and {} for binning {}'.format(
+            nrows // binning * binning - 1, binning))
+    # correrlate_flat needs several rows, so a band of rows around each slice is loaded for the flat matching
+    band = numpy.arange(-_FLAT_MATCH_MARGIN * binning, (_FLAT_MATCH_MARGIN + 1) * binning)
+    rows = numpy.unique((slices[:, numpy.newaxis] + band).ravel())
+    rows = rows[(rows >= 0) & (rows < nrows - nrows % binning)]
+    proj, flat, dark, theta = get_rawdata(scanlog_content, storage, scanindex=scanindex, rows=rows)
+    if binning > 1:
+        proj = rebin_stack(proj, binning, 'proj')
+        flat = rebin_stack(flat, binning, 'flat')
+        dark = rebin_stack(dark, binning, 'dark')
+
+    flat_with_min = correrlate_flat(proj, flat)
+    selected = numpy.searchsorted(rows[::binning], slices)
+    proj, flat, dark = proj[:, selected], flat[:, selected], dark[:, selected]
+    proj = normalize_corr(proj, flat, dark, flat_with_min, cutoff=cutoff)
+    proj = tomopy.minus_log(proj, ncore=ncore, out=proj)
+
+    # the cached arrays are shared by all callers, in-place processing needs a copy
+    for arr in (proj, theta, slices):
+        arr.setflags(write=False)
+    _sinogram_cache[cachekey] = (proj, theta, slices)
+    while len(_sinogram_cache) > _SINOGRAM_CACHE_SIZE:
+        _sinogram_cache.popitem(last=False)
+    return proj, theta, slices
+
+
+def _binned_center(center, binning):
+    """
+    Converts an unbinned rotation center into the position on the binned detector.
+    """
+    return (center - (binning - 1) / 2.0) / binning
+
+
+def _unbinned_center(center, binning):
+    """
+    Converts a rotation center on the binned detector into the unbinned position.
+    """
+    return center * binning + (binning - 1) / 2.0
+
+
+def preview_reconstruct(scanlog_content, raw_dir, slices, every=8, binning=2, center=None, cutoff=None,
+                        algorithm='gridrec', ncore=None, **kwargs):
+    """
+    Fast preview reconstruction of a few slices, e.g. for centering and quality checks. Only every nth projection
+    and only the detector rows of the requested slices are read, binned, normalized with the best matching flats and
+    reconstructed with tomopy.recon.
+
+    :param scanlog_content: <dict>
+        content of the scanlog (output of parse_scanlog)
+    :param raw_dir: <string> or storage backend
+        path to the raw data or a storage backend from p05tools.file.storage
+    :param slices: <list>
+        slices (detector rows, unbinned) to reconstruct
+    :param every: <int> (optional)
+        use only every nth projection (default: 8)
+    :param binning: <int> (optional)
+        binning factor of the detector (default: 2)
+    :param center: <float> (optional)
+        rotation center in unbinned pixels (default: tomopy default, center of the detector)
+    :param cutoff: <float> (optional)
+        Permitted maximum vaue for the normalized data
+    :param algorithm: <str> (optional)
+        reconstruction algorithm of tomopy.recon (default: 'gridrec')
+    :param ncore: <int> (optional)
+        Number of cores that will be assigned to jobs
+    :param kwargs: <**>
+        further kwargs of tomopy.recon
+
+    :return: <tuple> (3D ndarray, 1D ndarray)
+        binned reconstructed slices and the corresponding unbinned slice numbers. Binned slice k covers the
+        unbinned detector rows slices[k] to slices[k] + binning - 1.
+    """
+    proj, theta, slices = load_sinogram(scanlog_content, raw_dir, slices, every, binning, cutoff, ncore)
+    if center is not None:
+        center = _binned_center(center, binning)
+    rec = tomopy.recon(proj, theta, center=center, algorithm=algorithm, ncore=ncore, **kwargs)
+    logger.info('preview of slices {} with {} angles, binning {}'.format(list(slices), len(theta), binning))
+
+    return rec, slices
+
+
+def correrlate_flat(proj, flat, verbose=False, checkpoint=None):
     """
     Normalize raw projection data based on best correlation between projections and flat field images.
 
@@ -183,10 +311,16 @@ def correrlate_flat(proj, flat, verbose=False):
         3D flat field data
     :param verbose: <boolean> (optional)
         print progress in percent if True (default: False)
+    :param checkpoint: <RecoCheckpoint> (optional)
+        reuse the result of a previous run, stage 'flat_with_min'
 
     :return: ndarray
         Normalized 3D tomographic data
     """
+    if checkpoint is not None:
+        checkpoint.begin('flat_with_min', {'proj_shape': proj.shape, 'flat_shape': flat.shape})
+        if checkpoint.has('flat_with_min'):
+            return checkpoint.load('flat_with_min')
 
     proj = numpy.asarray(proj, numpy.float32)
     flat = numpy.asarray(flat, numpy.float32)
@@ -211,13 +345,18 @@ def correrlate_flat(proj, flat, verbose=False):
             100.0 * counter / proj.shape[0], proj_num, flat_with_min[proj_num]))
     if verbose:
         sys.stdout.write('\n')
+    if checkpoint is not None:
+        checkpoint.save('flat_with_min', flat_with_min)
+        checkpoint.finish('flat_with_min')
 
     return flat_with_min
 
 
-def normalize_corr(proj, flat, dark, flat_with_min, cutoff=None, ncore=None, out=None):
+def normalize_corr(proj, flat, dark, flat_with_min, cutoff=None, ncore=None, out=None, zinger_threshold=None,
+                   blocksize=32, checkpoint=None):
     """
-    Normalize raw projection data based on best correlation between projections and flat field images
+    Normalize raw projection data based on best correlation between projections and flat field images. The stack is
+    processed in blocks of projections; dark/flat correction, outlier removal and cutoff are done in one pass per block.
     
     :param proj: <ndarray>
         3D stack of projections
@@ -233,51 +372,387 @@ def normalize_corr(proj, flat, dark, flat_with_min, cutoff=None, ncore=None, out
         Number of cores that will be assigned to jobs
     :param out: <ndarray> (optional)
         Output array for result.  If same as arr, process will be done in-place.
+    :param zinger_threshold: <float> (optional)
+        replace pixels deviating more than zinger_threshold from the median of their 3x3 neighbourhood by this median
+        (zingers, hot and dead pixels). Applied to the normalized data (default: None, no outlier removal)
+    :param blocksize: <int> (optional)
+        number of projections processed in one block (default: 32)
+    :param checkpoint: <RecoCheckpoint> (optional)
+        store each normalized block and reuse the blocks of a previous run, stage 'normalized'. flat_with_min is
+        covered by the stage 'flat_with_min', pass the checkpoint to correrlate_flat as well.
 
     :return: <ndarray>
         Normalized 3D tomographic data
     """
-    import tomopy.util.mproc
-
     mean_dark = numpy.mean(dark, axis=0, dtype=numpy.float32)
-    proj = numpy.asarray(proj, numpy.float32)
     flat = numpy.asarray(flat, numpy.float32)
+    flat_with_min = numpy.asarray(flat_with_min)
 
-    corresponding_flat = flat[flat_with_min]
-
-    denom = numpy.subtract(corresponding_flat, mean_dark, corresponding_flat)
+    # dark corrected flats are computed once, the projections only index into them
+    denom = numpy.subtract(flat, mean_dark)
     denom[denom < 1e-6] = 1e-6
-    proj -= mean_dark
-    numpy.true_divide(proj, denom, proj)
-    if cutoff:
-        proj[proj > cutoff] = cutoff
-    return proj
+    if out is None:
+        out = numpy.empty(proj.shape, dtype=numpy.float32)
+    if checkpoint is not None:
+        checkpoint.begin('normalized', {'cutoff': cutoff, 'zinger_threshold': zinger_threshold, 'blocksize': blocksize})
+
+    for a in range(0, proj.shape[0], blocksize):
+        block = out[a:a + blocksize]
+        if checkpoint is not None and checkpoint.has('normalized', a):
+            block[:] = checkpoint.load('normalized', a)
+            continue
+        numpy.subtract(proj[a:a + blocksize], mean_dark, block, casting='unsafe')
+        numpy.true_divide(block, denom[flat_with_min[a:a + blocksize]], block)
+        if zinger_threshold:
+            _remove_outliers(block, zinger_threshold)
+        if cutoff:
+            block[block > cutoff] = cutoff
+        if checkpoint is not None:
+            checkpoint.save('normalized', block, a)
+    if checkpoint is not None:
+        checkpoint.finish('normalized')
+    return out
+
+
+def _remove_outliers(block, threshold):
+    """
+    Replaces pixels deviating more than threshold from the median of their 3x3 neighbourhood by the median. Works in
+    place on a block of projections.
+    """
+    from scipy.ndimage import median_filter
+
+    median = median_filter(block, size=(1, 3, 3))
+    outliers = numpy.abs(block - median) > threshold
+    block[outliers] = median[outliers]
+    logger.debug('replaced {} outliers'.format(numpy.count_nonzero(outliers)))
+
+
+def _overview_value(overview, keys):
+    """
+    Returns the first value of the scanlog overview found under one of the keys (case insensitive), None otherwise.
+    """
+    values = dict((str(key).strip().lower(), value) for key, value in overview.items())
+    for key in keys:
+        if key in values:
+            return values[key]
+    return None
+
+
+def phase_params_from_overview(overview):
+    """
+    Reads energy and sample-detector distance from the scanlog overview, see PHASE_ENERGY_KEYS and
+    PHASE_DISTANCE_KEYS. The energy is assumed in eV if larger than 1000 (keV otherwise), the distance in mm.
+
+    :param overview: <dict>
+        scanlog overview (output of parse_scanlog)
+
+    :return: <tuple> (float, float)
+        energy in keV and distance in cm, None if not found
+    """
+    energy = _overview_value(overview, PHASE_ENERGY_KEYS)
+    dist = _overview_value(overview, PHASE_DISTANCE_KEYS)
+    if energy is not None:
+        energy = float(energy)
+        if energy > 1000:
+            energy /= 1000.0
+    if dist is not None:
+        dist = float(dist) / 10.0
+    return energy, dist
+
+
+def _paganin_kernel(shape, pixel_size, dist, energy, delta_beta):
+    """
+    Paganin filter in the fourier space of numpy.fft.rfft2, cached per shape and physical parameters.
+
+    :return: <ndarray>
+        2D float32 filter kernel of shape (shape[0], shape[1] // 2 + 1)
+    """
+    key = (shape, pixel_size, dist, energy, delta_beta)
+    if key not in _paganin_kernel_cache:
+        # wavelength in cm, energy in keV
+        wavelength = 1.23984193e-7 / energy
+        freq_y = numpy.fft.fftfreq(shape[0], pixel_size)
+        freq_x = numpy.fft.rfftfreq(shape[1], pixel_size)
+        freq2 = freq_y[:, numpy.newaxis] ** 2 + freq_x[numpy.newaxis, :] ** 2
+        kernel = 1.0 / (1.0 + numpy.pi * wavelength * dist * delta_beta * freq2)
+        _paganin_kernel_cache[key] = kernel.astype(numpy.float32)
+    return _paganin_kernel_cache[key]
+
+
+def retrieve_phase(proj, pixel_size, delta_beta, dist=None, energy=None, overview=None, blocksize=16, pad=True,
+                   out=None, checkpoint=None):
+    """
+    Single distance phase retrieval with a Paganin type filter, applied block by block to normalized projections
+    (output of normalize_corr, before the negative logarithm). The filter kernel is cached per padded detector shape
+    and physical parameters.
+
+    :param proj: <ndarray>
+        3D stack of normalized projections
+    :param pixel_size: <float>
+        effective pixel size in cm
+    :param delta_beta: <float>
+        ratio of the refractive index decrement and the absorption index of the sample
+    :param dist: <float> (optional)
+        sample-detector distance in cm (default: read from overview)
+    :param energy: <float> (optional)
+        energy in keV (default: read from overview)
+    :param overview: <dict> (optional)
+        scanlog overview, used for dist and energy if these are not given
+    :param blocksize: <int> (optional)
+        number of projections filtered in one batch (default: 16)
+    :param pad: <boolean> (optional)
+        pad the projections by half their size with edge values to suppress fft wrap around (default: True)
+    :param out: <ndarray> (optional)
+        Output array for result.  If same as proj, process will be done in-place.
+    :param checkpoint: <RecoCheckpoint> (optional)
+        store each filtered block and reuse the blocks of a previous run, stage 'phase'
+
+    :return: <ndarray>
+        phase retrieved 3D tomographic data
+    """
+    if (dist is None or energy is None) and overview is not None:
+        overview_energy, overview_dist = phase_params_from_overview(overview)
+        energy = overview_energy if energy is None else energy
+        dist = overview_dist if dist is None else dist
+    if dist is None or energy is None:
+        raise ValueError('dist and energy must be given or be found in the scanlog overview')
+
+    if out is None:
+        out = numpy.empty(proj.shape, dtype=numpy.float32)
+    ny, nx = proj.shape[1:]
+    pad_y, pad_x = (ny // 4, nx // 4) if pad else (0, 0)
+    shape = (ny + 2 * pad_y, nx + 2 * pad_x)
+    kernel = _paganin_kernel(shape, pixel_size, dist, energy, delta_beta)
+    logger.info('phase retrieval with energy {} keV, distance {} cm, delta/beta {}'.format(energy, dist, delta_beta))
+    if checkpoint is not None:
+        checkpoint.begin('phase', {'pixel_size': pixel_size, 'delta_beta': delta_beta,
+                                   'dist': dist, 'energy': energy, 'blocksize': blocksize, 'pad': pad})
+
+    for a in range(0, proj.shape[0], blocksize):
+        if checkpoint is not None and checkpoint.has('phase', a):
+            out[a:a + blocksize] = checkpoint.load('phase', a)
+            continue
+        block = numpy.asarray(proj[a:a + blocksize], dtype=numpy.float32)
+        if pad:
+            block = numpy.pad(block, ((0, 0), (pad_y, pad_y), (pad_x, pad_x)), mode='edge')
+        filtered = numpy.fft.irfft2(numpy.fft.rfft2(block) * kernel, s=shape)
+        out[a:a + blocksize] = filtered[:, pad_y:pad_y + ny, pad_x:pad_x + nx]
+        if checkpoint is not None:
+            checkpoint.save('phase', out[a:a + blocksize], a)
+    if checkpoint is not None:
+        checkpoint.finish('phase')
+    return out
+
+
+def remove_stripes(sino, method='sort', size=21, sigma=3.0, nthreads=None):
+    """
+    Suppresses stripes in sinograms, which cause ring artefacts in the reconstruction. Works in place.
+
+    Methods:
+        * 'sort': sorts each detector column along the angles, median filters the sorted sinogram across the detector
+          and restores the original order (Vo et al., Opt. Express 26, 2018). Removes partial and full stripes.
+        * 'fft': subtracts the high frequency part of the mean detector profile, the low pass is a gaussian filter
+          applied in fourier space. Fast, removes full stripes.
+
+    :param sino: <ndarray>
+        3D float32 stack of projections (angles, rows, columns), e.g. one chunk of chunk_reconstruct
+    :param method: <str> (optional)
+        'sort' or 'fft' (default: 'sort')
+    :param size: <int> (optional)
+        window size of the median filter across the detector for method 'sort' (default: 21)
+    :param sigma: <float> (optional)
+        width in pixels of the gaussian low pass of the profile for method 'fft' (default: 3.0)
+    :param nthreads: <int> (optional)
+        number of threads for method 'sort', one sinogram per task (default: number of cpus)
+
+    :return: <ndarray>
+        sino, with stripes removed
+    """
+    if method == 'sort':
+        from scipy.ndimage import median_filter
+        from concurrent.futures import ThreadPoolExecutor
+
+        def sort_filter(row):
+            single_sino = sino[:, row, :]
+            order = numpy.argsort(single_sino, axis=0)
+            sorted_sino = numpy.take_along_axis(single_sino, order, axis=0)
+            numpy.put_along_axis(single_sino, order, median_filter(sorted_sino, size=(1, size)), axis=0)
+
+        with ThreadPoolExecutor(nthreads) as pool:
+            list(pool.map(sort_filter, range(sino.shape[1])))
+    elif method == 'fft':
+        profile = numpy.mean(sino, axis=0)
+        # reflect the profile at the edges to suppress the periodic continuation of the fft
+        pad = min(int(4 * sigma) + 1, profile.shape[-1] - 1)
+        padded = numpy.pad(profile, ((0, 0), (pad, pad)), mode='reflect')
+        freq = numpy.fft.rfftfreq(padded.shape[-1])
+        lowpass = numpy.fft.irfft(numpy.fft.rfft(padded, axis=-1) * numpy.exp(-2 * (numpy.pi * sigma * freq) ** 2),
+                                  padded.shape[-1], axis=-1)
+        sino -= (profile - lowpass[:, pad:pad + profile.shape[-1]]).astype(sino.dtype)
+    else:
+        raise ValueError('unknown stripe removal method: {}'.format(method))
+    return sino
+
 
 def chunk_reconstruct(chunksize, *args, **kwargs):
     """
-    wrapper to tompy.recon. Reconstructs data in chunks using tomopy.recon.
+    wrapper to tompy.recon. Reconstructs data in chunks using tomopy.recon. Optionally, stripes are removed from
+    each chunk right before its reconstruction (see remove_stripes).
 
     :param chunksize: <int>
         number of slices tha should be processed in one chunk
     :param args: <*>
         arguments of tomopy.recon
     :param kwargs: <**>
-        kwargs of tomopy.recon
+        kwargs of tomopy.recon and
+            * stripe_filter: <str> method of remove_stripes, 'sort' or 'fft' (default: None, no stripe removal)
+            * stripe_kwargs: <dict> further kwargs of remove_stripes
+            * writer: volume writer (see p05tools.reco.output), receives each reconstructed chunk instead of
+              collecting the volume in memory
+            * checkpoint: <RecoCheckpoint> store each reconstructed chunk and reuse the chunks of a previous run,
+              stage 'reconstruction'
 
     :return: <ndarray>
-        reconstructuted 3D object
+        reconstructuted 3D object, None if a writer is given
     """
+    stripe_filter = kwargs.pop('stripe_filter', None)
+    stripe_kwargs = kwargs.pop('stripe_kwargs', None) or {}
+    writer = kwargs.pop('writer', None)
+    checkpoint = kwargs.pop('checkpoint', None)
     proj = args[0]
+    args = args[1:]
+    if checkpoint is not None:
+        params = dict(('arg{}'.format(i), arg) for i, arg in enumerate(args))
+        params.update(kwargs)
+        params.update({'proj_shape': proj.shape, 'chunksize': chunksize, 'stripe_filter': stripe_filter,
+                       'stripe_kwargs': stripe_kwargs})
+        checkpoint.begin('reconstruction', params)
     stacksize = proj.shape
     chunks = _chunk_list(numpy.arange(stacksize[1]), chunksize)
-    rec = numpy.zeros([stacksize[1], stacksize[1], stacksize[2]], dtype=numpy.float32)
+    rec = None
     for chunk in chunks:
         a, b = chunk[0], chunk[-1] + 1
-        args[0] = proj[:,a,b]
-        rec[a:b, :] = tomopy.recon(proj[:, a:b], *args, **kwargs)
+        if checkpoint is not None and checkpoint.has('reconstruction', a):
+            chunk_rec = checkpoint.load('reconstruction', a)
+        else:
+            chunk_proj = proj[:, a:b]
+            if stripe_filter:
+                # the chunk copy is filtered in place, the input stack is not modified
+                chunk_proj = remove_stripes(numpy.array(chunk_proj, dtype=numpy.float32), stripe_filter,
+                                            **stripe_kwargs)
+            chunk_rec = tomopy.recon(chunk_proj, *args, **kwargs)
+            if checkpoint is not None:
+                checkpoint.save('reconstruction', chunk_rec, a)
+        if writer is not None:
+            writer.write(chunk_rec, a)
+        else:
+            if rec is None:
+                rec = numpy.zeros((stacksize[1],) + chunk_rec.shape[1:], dtype=numpy.float32)
+            rec[a:b] = chunk_rec
+        logger.info('reconstructed slices {} to {}'.format(a, b - 1))
+    if checkpoint is not None:
+        checkpoint.finish('reconstruction')
 
     return rec
 
+
+def _init_center_worker(sino, theta):
+    """
+    Initializer of the find_center worker processes. Stores the sinograms once per process.
+    """
+    global _center_sino, _center_theta
+    _center_sino, _center_theta = sino, theta
+
+
+def _score_center(center, algorithm, metric, kwargs):
+    """
+    Reconstructs the cached sinograms with one center and scores the sharpness of the result. Runs in a worker
+    process of find_center.
+
+    :return: <float>
+        score, higher is better
+    """
+    rec = tomopy.recon(_center_sino, _center_theta, center=center, algorithm=algorithm, ncore=1, **kwargs)
+    rec = tomopy.circ_mask(rec, axis=0, ratio=0.95)
+    if metric == 'entropy':
+        hist, _ = numpy.histogram(rec, bins=256)
+        hist = hist[hist > 0] / float(hist.sum())
+        return float(numpy.sum(hist * numpy.log2(hist)))
+    if metric == 'gradient':
+        grad_y, grad_x = numpy.gradient(rec, axis=(1, 2))
+        return float(numpy.mean(grad_x ** 2 + grad_y ** 2) / (numpy.var(rec) + 1e-12))
+    raise ValueError('unknown metric: {}'.format(metric))
+
+
+def find_center(scanlog_content, raw_dir, slices, center_range, nsteps=21, tol=0.25, every=1, binning=1,
+                cutoff=None, metric='entropy', nproc=None, algorithm='gridrec', **kwargs):
+    """
+    Searches the rotation center. The sinograms of the given slices are loaded and normalized once (and cached, see
+    load_sinogram). A sweep of centers is reconstructed in parallel worker processes and each reconstruction is
+    scored by an image sharpness metric. The sweep is refined around the best center until the step size is below tol.
+
+    :param scanlog_content: <dict>
+        content of the scanlog (output of parse_scanlog)
+    :param raw_dir: <string> or storage backend
+        path to the raw data or a storage backend from p05tools.file.storage
+    :param slices: <list>
+        slices (detector rows, unbinned) used for the search
+    :param center_range: <tuple> (float, float)
+        first and last center (unbinned pixels) of the coarse sweep
+    :param nsteps: <int> (optional)
+        number of centers per sweep, at least 5 (default: 21)
+    :param tol: <float> (optional)
+        final step size in unbinned pixels (default: 0.25)
+    :param every: <int> (optional)
+        use only every nth projection (default: 1)
+    :param binning: <int> (optional)
+        binning factor of the detector (default: 1)
+    :param cutoff: <float> (optional)
+        Permitted maximum vaue for the normalized data
+    :param metric: <str> (optional)
+        'entropy' (negative entropy of the grey value histogram) or 'gradient' (normalized gradient energy)
+    :param nproc: <int> (optional)
+        number of worker processes (default: number of cpus)
+    :param algorithm: <str> (optional)
+        reconstruction algorithm of tomopy.recon (default: 'gridrec')
+    :param kwargs: <**>
+        further kwargs of tomopy.recon
+
+    :return: <tuple> (float, 1D ndarray, 1D ndarray)
+        best center, all tested centers (sorted) and their scores, centers in unbinned pixels
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if nsteps < 5:
+        raise ValueError('nsteps must be at least 5')
+    sino, theta, slices = load_sinogram(scanlog_content, raw_dir, slices, every, binning, cutoff)
+    low, high = _binned_center(center_range[0], binning), _binned_center(center_range[1], binning)
+    tol = tol / float(binning)
+
+    centers, scores = list(), list()
+    with ProcessPoolExecutor(nproc, initializer=_init_center_worker, initargs=(sino, theta)) as pool:
+        while True:
+            sweep = numpy.linspace(low, high, nsteps)
+            # the refined sweeps contain the best center and the ends of its interval, which are already scored
+            if centers:
+                sweep = sweep[~numpy.isclose(sweep[:, numpy.newaxis], centers).any(axis=1)]
+            futures = [pool.submit(_score_center, center, algorithm, metric, kwargs) for center in sweep]
+            centers.extend(sweep)
+            scores.extend(future.result() for future in futures)
+            best = centers[int(numpy.argmax(scores))]
+            step = (high - low) / (nsteps - 1.0)
+            logger.info('center sweep {:.2f} - {:.2f}, best center {:.2f}'.format(
+                _unbinned_center(low, binning), _unbinned_center(high, binning), _unbinned_center(best, binning)))
+            if step <= tol:
+                break
+            low, high = best - step, best + step
+
+    centers = numpy.asarray(centers)
+    scores = numpy.asarray(scores)
+    order = numpy.argsort(centers)
+    return _unbinned_center(best, binning), _unbinned_center(centers[order], binning), scores[order]
+
+
 def init_filelog(identifier, scanname, recodir):
     """
     Initializes a logger for reconstruction.